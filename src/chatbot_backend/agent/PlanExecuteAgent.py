@@ -1,13 +1,17 @@
 import sqlite3
+import asyncio
+import json
 import operator
+import threading
 from typing import TypedDict, Annotated, List, Tuple, Union
 from typing_extensions import TypedDict
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.sqlite import SqliteSaver
+from .BatchedSqliteSaver import BatchedSqliteSaver
 from .utils import get_bin_documentation
 from .QueryAgent import QueryAgent
+from .SemanticCache import SemanticCache
 from IPython.display import Image, display
 from pydantic import BaseModel, Field
 import logging
@@ -130,20 +134,58 @@ REPLAN_PROMPT = """
     → Response: "The first RC signal drop occurred at 34000ms."
 """
 
+SUMMARIZE_HISTORY_PROMPT = """
+    You are summarizing older turns of a conversation between a user and a UAV flight log analysis agent.
+    Summarize the following exchanges in 3 bullets.
+    Keep concrete values (altitudes, timestamps, table names, error causes) so later turns can still refer to them.
+    Only output the bullets, nothing else.
+"""
+
 class PlanExecuteAgent:
-    def __init__(self, data, session_id):
+    def __init__(self, data, session_id, model=None):
         sqlite_conn = sqlite3.connect(f"./checkpoints/{session_id}_checkpoints.sqlite", check_same_thread=False)
-        self.memory = SqliteSaver(sqlite_conn)
+        # WAL lets readers run alongside the writer and makes commits much
+        # cheaper; the remaining pragmas trade a little durability for far
+        # fewer fsyncs on the checkpoint hot path.
+        for pragma in (
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA busy_timeout=5000",
+            "PRAGMA temp_store=MEMORY",
+            "PRAGMA cache_size=-20000",
+            "PRAGMA mmap_size=268435456",
+        ):
+            sqlite_conn.execute(pragma)
+        self._sqlite_conn = sqlite_conn
+        self._closed = False
+        self.memory = BatchedSqliteSaver(sqlite_conn)
         self.session_id = session_id
         self.analysis_cache = {}
-        self.model = ChatOpenAI(model="gpt-4o", 
-                                temperature=0,
-                                max_tokens=1000,
-                                request_timeout=10,
-                                max_retries=2)
+        self._stats_cache = {}
+        self.response_cache = SemanticCache()
+        # Prefer a caller-supplied (shared) client: one httpx pool across all
+        # sessions keeps connections to OpenAI warm instead of paying a TLS
+        # handshake per new session.
+        self.model = model or ChatOpenAI(model="gpt-4o",
+                                         temperature=0,
+                                         max_tokens=1000,
+                                         request_timeout=10,
+                                         max_retries=2)
 
         self.data = data
+        # Numeric slices are what analyse_data works on; carve them out once
+        # per session instead of re-running dtype introspection on every call.
+        # copy() detaches them from the parent frames so later ops stay cheap.
+        self._numeric_views = {
+            name: df.select_dtypes(include="number").copy()
+            for name, df in self.data.items()
+        }
         self.documentation = get_bin_documentation(self.data)
+        # Format the documentation into the system prompts once: the strings are
+        # large and static per session, so rebuilding them on every LLM call only
+        # burns CPU and breaks OpenAI's automatic prefix caching.
+        self._plan_system = PLAN_OR_RESPONSE_PROMPT.format(documentation=self.documentation)
+        self._replan_system = REPLAN_PROMPT.format(documentation=self.documentation)
         self.query_agent = QueryAgent(self.data, self.documentation, self.model)
 
 
@@ -166,19 +208,51 @@ class PlanExecuteAgent:
             ["agent", "update_history"],
         )
         self.graph = builder.compile(checkpointer=self.memory)
+        # Warm every table's statistics while the first LLM call waits on the
+        # network; pandas releases the GIL in its C kernels, so this runs
+        # truly concurrently and analyse_data becomes a dict lookup.
+        threading.Thread(target=self._prewarm_analyses, daemon=True).start()
         # display(Image(self.graph.get_graph(xray=True).draw_mermaid_png()))
         # png_data = self.graph.get_graph(xray=True).draw_mermaid_png()
         # with open("plan_execute_agent.png", "wb") as f:
         #     f.write(png_data)
 
 
-    def call_query_agent(self, question) -> str:
+    def _prewarm_analyses(self):
+        for table_name in list(self.data.keys()):
+            try:
+                self.analyse_data(table_name)
+            except Exception as e:
+                logger.warning("Analysis prewarm failed for table %s: %s", table_name, e)
+
+    def close(self):
+        """
+        Flush pending checkpoints and release the SQLite connection. Called on
+        cache eviction so expired sessions don't leak file descriptors until
+        GC gets around to them.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.memory.flush()
+        except Exception as e:
+            logger.warning("Could not flush checkpoints on close: %s", e)
+        try:
+            self._sqlite_conn.close()
+        except sqlite3.Error as e:
+            logger.warning("Could not close checkpoint connection: %s", e)
+
+    def __del__(self):
+        self.close()
+
+    async def call_query_agent(self, question) -> str:
         """
             Generates a SQL query based on a flight-related user question and runs it on the telemetry database.
             Ideal for questions like: 'What was the maximum altitude?' or 'When did signal loss first occur?'
         """
         logger.info("Querying DB: %s", question)
-        answer = self.query_agent.call(question)
+        answer = await self.query_agent.call(question)
         logger.info("Got answer:\n%s", pprint.pformat(answer))
         return answer
         
@@ -195,63 +269,81 @@ class PlanExecuteAgent:
             error_msg = f"Error: Table '{table_name}' not found. Available tables: {list(self.data.keys())}"
             self.analysis_cache[cache_key] = error_msg
             return error_msg
-        df = self.data[table_name]
-        df = df.select_dtypes(include="number")
-
-        if df.empty:
+        if self._numeric_views[table_name].empty:
             return f"Table {table_name} has no numeric telemetry data."
 
-        summary = [f"Summary of `{table_name}` Table\n"]
+        # Summaries are small text; one per table is a bounded cache, so no
+        # eviction needed.
+        result = self._format_stats(table_name, self._stats_dict(table_name))
+        self.analysis_cache[cache_key] = result
+        return result
 
-        for col in df.columns:
-            col_data = df[col].dropna()
-            if len(col_data) == 0:
+    def _stats_dict(self, table_name: str) -> dict:
+        """
+        Per-column statistics for a table as a compact dict, cached per
+        session. This is the structured form fed back into `replan`;
+        `_format_stats` renders it for humans.
+        """
+        cached = self._stats_cache.get(table_name)
+        if cached is not None:
+            return cached
+        df = self._numeric_views[table_name]
+
+        # One vectorized pass per statistic across all columns (NaNs are
+        # skipped by the pandas reductions) instead of 7+ kernel dispatches
+        # per column in a Python loop.
+        stats_df = df.agg(['min', 'max', 'mean', 'std', 'skew', 'kurt']).T
+        stats_df['n_unique'] = df.nunique(dropna=True)
+        non_null_counts = df.count()
+
+        stats = {}
+        for row in stats_df.itertuples():
+            col = row.Index
+            if non_null_counts[col] == 0:
                 continue
 
-            line = f"- **{col}**: "
-            stats = {
-                "min": col_data.min(),
-                "max": col_data.max(),
-                "mean": col_data.mean(),
-                "std": col_data.std(),
-                "skew": col_data.skew(),
-                "kurt": col_data.kurtosis(),
-                "n_unique": col_data.nunique()
-            }
-
             notes = []
-            if stats["n_unique"] == 1:
+            if row.n_unique == 1:
                 notes.append("constant")
-            elif stats["std"] > 2 * abs(stats["mean"]):
+            elif row.std > 2 * abs(row.mean):
                 notes.append("high variance")
-            elif stats["std"] == 0:
+            elif row.std == 0:
                 notes.append("no variation")
-            if abs(stats["skew"]) > 2:
+            if abs(row.skew) > 2:
                 notes.append("strongly skewed")
-            if abs(stats["kurt"]) > 10:
+            if abs(row.kurt) > 10:
                 notes.append("peaked or heavy tails")
 
-            line += (
-                f"min={stats['min']:.2f}, max={stats['max']:.2f}, "
-                f"mean={stats['mean']:.2f}, std={stats['std']:.2f}, "
-                f"skew={stats['skew']:.2f}, kurtosis={stats['kurt']:.2f}, "
-                f"unique={stats['n_unique']}"
-            )
-            if notes:
-                line += f" — _{' | '.join(notes)}_"
-
-            summary.append(line)
+            stats[col] = {
+                "min": round(float(row.min), 3),
+                "max": round(float(row.max), 3),
+                "mean": round(float(row.mean), 3),
+                "std": round(float(row.std), 3),
+                "skew": round(float(row.skew), 3),
+                "kurt": round(float(row.kurt), 3),
+                "n_unique": int(row.n_unique),
+                "notes": notes,
+            }
 
-        result = "\n".join(summary)
-        self.analysis_cache[cache_key] = result
-        
-        if len(self.analysis_cache) > 20:
-            oldest_key = next(iter(self.analysis_cache))
-            del self.analysis_cache[oldest_key]
+        self._stats_cache[table_name] = stats
+        return stats
 
+    def _format_stats(self, table_name: str, stats: dict) -> str:
+        summary = [f"Summary of `{table_name}` Table\n"]
+        for col, s in stats.items():
+            line = (
+                f"- **{col}**: "
+                f"min={s['min']:.2f}, max={s['max']:.2f}, "
+                f"mean={s['mean']:.2f}, std={s['std']:.2f}, "
+                f"skew={s['skew']:.2f}, kurtosis={s['kurt']:.2f}, "
+                f"unique={s['n_unique']}"
+            )
+            if s["notes"]:
+                line += f" — _{' | '.join(s['notes'])}_"
+            summary.append(line)
         return "\n".join(summary)
     
-    def get_plan_or_response(self, state):
+    async def get_plan_or_response(self, state):
         conversation_context = ""
         if state.get("conversation_history"):
             conversation_context = "\n\nPrevious conversation:\n"
@@ -259,10 +351,10 @@ class PlanExecuteAgent:
                 conversation_context += f"User: {user_input}\nAgent: {agent_response}\n"
         
         messages = [
-            SystemMessage(content=PLAN_OR_RESPONSE_PROMPT.format(documentation=self.documentation)),
+            SystemMessage(content=self._plan_system),
             HumanMessage(content=f"Here is the user input: {state['input']}{conversation_context}")
         ]
-        result = self.model.with_structured_output(TreatUserInput).invoke(messages)
+        result = await self.model.with_structured_output(TreatUserInput).ainvoke(messages)
         
         if isinstance(result.action, Plan):
             logger.info("Got Plan:\n%s", pprint.pformat(result.action.steps))
@@ -271,43 +363,89 @@ class PlanExecuteAgent:
             logger.info("Answering:\n%s", pprint.pformat(result.action.response))
             return {"response": result.action.response}
 
-    def execute_step(self, state):
+    async def execute_step(self, state):
         if len(state["plan"]) == 0:
             return {"past_steps": [(None, "")]}
         step = state["plan"][0]  # Get first step
-        
+
+        # Exploratory plans often open with several Analysis steps that have
+        # no data dependency on each other; run the whole contiguous prefix
+        # concurrently and record all results in one graph step.
+        if isinstance(step, Analysis):
+            analyses = []
+            for planned in state["plan"]:
+                if not isinstance(planned, Analysis):
+                    break
+                analyses.append(planned)
+            if len(analyses) > 1:
+                logger.info("Executing %d analyses concurrently: %s",
+                            len(analyses), [a.table_name for a in analyses])
+                results = await asyncio.gather(
+                    *[asyncio.to_thread(self.analyse_data, a.table_name) for a in analyses]
+                )
+                return {"past_steps": list(zip(analyses, results))}
+
         if isinstance(step, Query):
             logger.info("Executing query: %s", step.question)
-            result = self.query_agent.call(step.question)
+            result = await self.query_agent.call(step.question)
         elif isinstance(step, Analysis):
             logger.info("Executing analysis: %s", step.table_name)
-            result = self.analyse_data(step.table_name)
+            # pandas work is blocking; keep it off the event loop.
+            result = await asyncio.to_thread(self.analyse_data, step.table_name)
         else:
             logger.error("Unknown step type: %s", type(step))
             result = "Error: Unknown step type"
         
         return {"past_steps": [(step, result)]}
 
-    def replan(self, state):
+    async def replan(self, state):
+        # Fast path: the plan is exhausted and the last step was a query whose
+        # answer is already concise and error-free. Returning it directly
+        # saves a structured-output LLM call on the very common
+        # single-query plan.
+        if state["past_steps"] and len(state.get("plan", [])) <= 1:
+            last_step, last_result = state["past_steps"][-1]
+            if (
+                isinstance(last_step, Query)
+                and isinstance(last_result, str)
+                and 0 < len(last_result) < 500
+                and not any(marker in last_result.lower()
+                            for marker in ("error", "failed", "reformulate", "went wrong", "couldn't"))
+            ):
+                logger.info("Plan exhausted with a concise answer, skipping replan call")
+                return {"response": last_result}
+
         conversation_context = ""
         if state.get("conversation_history"):
             conversation_context = "\n\nPrevious conversation:\n"
             for i, (user_input, agent_response) in enumerate(state["conversation_history"]):
                 conversation_context += f"User: {user_input}\nAgent: {agent_response}\n"
 
+        # Replay Analysis results as compact JSON stats instead of the
+        # markdown rendering: same information, far fewer prompt tokens.
+        past_steps = [
+            (step, json.dumps(self._stats_cache[step.table_name], separators=(",", ":")))
+            if isinstance(step, Analysis) and step.table_name in self._stats_cache
+            else (step, result)
+            for step, result in state["past_steps"]
+        ]
+
         prompt = f"""Your objective was this: {state['input']}\n
                         Your last plan was this: {state['plan']}\n
-                        You have currently done the following steps: {state['past_steps']}\n
+                        You have currently done the following steps: {past_steps}\n
                         Don't repeat any steps you already did.
                         Based on the completed steps, decide what are the next steps"""
         if len(state["past_steps"]) > 5:
             prompt += "\n\nYou have already done many steps, it is time to give a response."
-        
+        # Conversation history changes every turn, so it goes last to keep the
+        # earlier prompt tokens stable for prefix caching.
+        prompt += conversation_context
+
         messages = [
-            SystemMessage(content=REPLAN_PROMPT.format(documentation=self.documentation)),
+            SystemMessage(content=self._replan_system),
             HumanMessage(content=prompt)
         ]
-        output = self.model.with_structured_output(Act).invoke(messages)
+        output = await self.model.with_structured_output(Act).ainvoke(messages)
         if isinstance(output.action, Response):
             return {"response": output.action.response}
         else:
@@ -318,10 +456,28 @@ class PlanExecuteAgent:
             logger.info("Last step:\n%s\nNew Plan:\n%s", pprint.pformat(state['past_steps'][-1]), pprint.pformat(new_plan))
             return {"plan": new_plan}
 
-    def update_conversation_history(self, state):
+    async def update_conversation_history(self, state):
         logger.info("Updating conversation history")
-        if len(state["conversation_history"]) >= 10:
-            state["conversation_history"].pop(0)
+        # End of the turn: persist all buffered checkpoint rows in one commit.
+        await asyncio.to_thread(self.memory.flush)
+        history = state["conversation_history"]
+        if len(history) >= 6:
+            # Roll the oldest turns into one synthetic entry so the prompt
+            # context stays bounded instead of growing with every turn; the
+            # most recent turns remain verbatim.
+            oldest = history[:3]
+            transcript = "\n".join(f"User: {u}\nAgent: {a}" for u, a in oldest)
+            try:
+                summary = (await self.model.ainvoke([
+                    SystemMessage(content=SUMMARIZE_HISTORY_PROMPT),
+                    HumanMessage(content=transcript),
+                ])).content
+                del history[:3]
+                history.insert(0, ("[summary]", summary))
+            except Exception as e:
+                logger.warning("History summarization failed, keeping verbatim turns: %s", e)
+                if len(history) >= 10:
+                    history.pop(0)
         return {"conversation_history": [(state["input"], state["response"])]}
 
     # def call(self, input_question: str) -> str:
@@ -342,10 +498,24 @@ class PlanExecuteAgent:
     #     except Exception as e:
     #         return "Please reformulate."
         
-    def call_stream(self, input_question: str):
+    async def call_stream(self, input_question: str):
         thread = {"configurable": {"thread_id": self.session_id}}
         logger.info(f"Received user question: {input_question}")
-        for step in self.graph.stream({
+        cached = await asyncio.to_thread(self.response_cache.get, input_question)
+        if cached is not None:
+            logger.info("Semantic cache hit, skipping graph run")
+            # Record the turn even though the graph never runs, so follow-up
+            # questions still see it in the conversation history.
+            await asyncio.to_thread(
+                self.graph.update_state,
+                thread,
+                {"conversation_history": [(input_question, cached)]},
+                as_node="update_history",
+            )
+            await asyncio.to_thread(self.memory.flush)
+            yield {"type": "response", "value": cached}
+            return
+        async for step in self.graph.astream({
             "input": input_question,
             "plan": [],
             "past_steps": [],
@@ -369,8 +539,12 @@ class PlanExecuteAgent:
                 else:
                     yield {"type": "error", "value": "Please reformulate."}
 
+        # The final checkpoint is written after the update_history node ran, so
+        # flush once more to persist the tail of the turn.
+        await asyncio.to_thread(self.memory.flush)
         try:
             response = step['update_history']["conversation_history"][-1][1]
+            await asyncio.to_thread(self.response_cache.put, input_question, response)
             yield {"type": "response", "value": response}
         except Exception as e:
             yield {"type": "error", "value": "Please reformulate."}
\ No newline at end of file
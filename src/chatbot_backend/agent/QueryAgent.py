@@ -1,7 +1,9 @@
 import os
+import asyncio
 from .utils import is_safe_query
-from pandasql import sqldf
-import json
+from .SemanticCache import SemanticCache
+import duckdb
+import orjson
 from langgraph.graph import StateGraph
 from IPython.display import Image, display
 from typing import TypedDict, Annotated, List, Optional
@@ -23,17 +25,17 @@ class Query(BaseModel):
 
 WRITE_QUERY_PROMPT = (
     "You are an expert data analyst. Given a user's question about a dataset and the dataset documentation,"
-    "Write a syntactically valid SQL query that will answer the question"
+    "Write a syntactically valid SQL query (DuckDB dialect) that will answer the question"
     "Only output the SQL query, nothing else."
     "The query should target specific columns."
     "The result of the query should be a table with no more than 30 rows!."
-    
+
 )
 
 REWRITE_QUERY_PROMPT = (
     "You are an expert data analyst. Given a user's question about a dataset, "
     "the dataset documentation, and a previously failed SQL query, "
-    "write a corrected SQL query that avoids the same error. "
+    "write a corrected SQL query (DuckDB dialect) that avoids the same error. "
     "Only output the SQL query, nothing else."
     "The query should target specific columns."
     "The result of the query should be a table with no more than 30 rows!."
@@ -50,6 +52,26 @@ class QueryAgent:
         self.data = data
         self.documentation = documentation
         self.model = model
+        self.response_cache = SemanticCache()
+        # DuckDB queries the registered DataFrames in place (zero-copy via
+        # Arrow), unlike pandasql which rebuilt an in-memory SQLite database
+        # from every DataFrame on each call.
+        self._ddb = duckdb.connect()
+        for name, df in self.data.items():
+            self._ddb.register(name, df)
+        # Build the system messages once, with the (large, static) documentation
+        # up front and only the per-call fields in the HumanMessage tail. Every
+        # call then shares a byte-identical prompt prefix, which is what OpenAI's
+        # automatic prefix cache keys on.
+        self._write_query_system = SystemMessage(
+            content=WRITE_QUERY_PROMPT + "\n\nDOCUMENTATION:\n" + self.documentation
+        )
+        self._rewrite_query_system = SystemMessage(
+            content=REWRITE_QUERY_PROMPT + "\n\nDOCUMENTATION:\n" + self.documentation
+        )
+        self._analyze_result_system = SystemMessage(
+            content=ANALYZE_RESULT_PROMPT + "\n\nDOCUMENTATION:\n" + self.documentation
+        )
 
         builder = StateGraph(QueryAgentState)
         builder.add_node("write_query", self.write_query)
@@ -74,27 +96,35 @@ class QueryAgent:
         # display(Image(self.query_agent.get_graph(xray=True).draw_mermaid_png()))
 
     
-    def write_query(self, state: QueryAgentState):
+    async def write_query(self, state: QueryAgentState):
         messages = [
-            SystemMessage(content=WRITE_QUERY_PROMPT),
-            HumanMessage(content=f"Here is the question: {state['question']}, here is the dataset documentation: {self.documentation}\n")
+            self._write_query_system,
+            HumanMessage(content=f"Here is the question: {state['question']}\n")
         ]
-        query = self.model.with_structured_output(Query).invoke(messages)
+        query = await self.model.with_structured_output(Query).ainvoke(messages)
         return {"sql_query": query.query, "attempts": state["attempts"] + [query]}
 
-    def execute_query(self, state: QueryAgentState):
+    async def execute_query(self, state: QueryAgentState):
         if not is_safe_query(state['sql_query']):
-            return {"sql_result": None, "sql_error": f"The query {state['query']} is not safe to execute."}
+            return {"sql_result": None, "sql_error": f"The query {state['sql_query']} is not safe to execute."}
         try:
-            df = sqldf(state['sql_query'], self.data)
-            if len(df) > 100:
-                df = df.head(100)
-            result = json.dumps(df.to_dict(orient="records"), indent=2)
+            # DuckDB holds the GIL only partially but still blocks this
+            # coroutine; run it in a worker thread to keep the event loop free.
+            df = await asyncio.to_thread(
+                lambda: self._ddb.execute(state['sql_query']).fetch_df()
+            )
+            # Truncate before building the records dict so the serialization
+            # work is bounded; orjson handles the NumPy scalars directly
+            # without a pure-Python encoding pass.
+            result = orjson.dumps(
+                df.head(100).to_dict(orient="records"),
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+            ).decode()
             return {"sql_result": result, "sql_error": None}
         except Exception as e:
             return {"sql_result": None, "sql_error": str(e)}
     
-    def replan_query(self, state: QueryAgentState):
+    async def replan_query(self, state: QueryAgentState):
         if len(state["attempts"]) >= 5:
             return {"final_answer": "Failed after 5 attempts."}
         prompt = f"""
@@ -107,30 +137,37 @@ class QueryAgent:
             Please write a corrected SQL query that avoids the same error.
         """
         messages = [
-            SystemMessage(content=REWRITE_QUERY_PROMPT),
+            self._rewrite_query_system,
             HumanMessage(content=prompt)
         ]
-        new_query = self.model.invoke(messages).content
+        new_query = (await self.model.ainvoke(messages)).content
         return {"sql_query": new_query, "attempts": state["attempts"] + [new_query]}
 
-    def analyze_result(self, state: QueryAgentState):
+    async def analyze_result(self, state: QueryAgentState):
         messages = [
-            SystemMessage(content=ANALYZE_RESULT_PROMPT),
-            HumanMessage(content=f"Here is the question: {state['question']}\nHere is the query: {state['sql_query']}\nHere is the result: {state['sql_result']}\n Here is the documentation: {self.documentation}\n")
+            self._analyze_result_system,
+            HumanMessage(content=f"Here is the question: {state['question']}\nHere is the query: {state['sql_query']}\nHere is the result: {state['sql_result']}\n")
         ]
-        response = self.model.invoke(messages).content
+        response = (await self.model.ainvoke(messages)).content
         return {"final_answer": response}
 
-    def call(self, question):
+    async def call(self, question):
+        cached = await asyncio.to_thread(self.response_cache.get, question)
+        if cached is not None:
+            return cached
         final_step = None
         try:
-            for step in self.query_agent.stream({
+            async for step in self.query_agent.astream({
                 "question": question,
                 "attempts": [],
             }, config={"recursion_limit": 5}):
                 final_step = step
-            return final_step['analyze_result']["final_answer"] if final_step else "Please reformulate."
-        
+            if final_step and 'analyze_result' in final_step:
+                answer = final_step['analyze_result']["final_answer"]
+                await asyncio.to_thread(self.response_cache.put, question, answer)
+                return answer
+            return "Please reformulate."
+
         except GraphRecursionError as e:
             return "I couldn't access the information"
         
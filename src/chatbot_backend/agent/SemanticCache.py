@@ -0,0 +1,87 @@
+import hashlib
+import logging
+from collections import OrderedDict
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+logger = logging.getLogger(__name__)
+
+_shared_embeddings = None
+
+
+def _get_shared_embeddings():
+    # One embeddings client (and its connection pool) for all sessions.
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        _shared_embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    return _shared_embeddings
+
+
+class SemanticCache:
+    """
+    Per-session cache of (question, answer) pairs keyed by embedding similarity.
+    Exact repeats are answered via a hash lookup without touching the network;
+    near-duplicates ("max altitude?" vs "what was the max altitude") are matched
+    by cosine similarity against all stored embeddings in one vectorized matmul.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.92, max_entries: int = 200, embeddings=None):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.embeddings = embeddings or _get_shared_embeddings()
+        self._entries = OrderedDict()  # hash -> (unit-norm embedding, question, answer)
+        self._matrix = None  # stacked embeddings, rows aligned with _entries order
+        self._pending = None  # (hash, embedding) from the last miss, reused by put()
+
+    @staticmethod
+    def _hash(question: str) -> str:
+        return hashlib.sha1(question.strip().lower().encode()).hexdigest()
+
+    def _embed(self, question: str):
+        vec = np.asarray(self.embeddings.embed_query(question), dtype=np.float64)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _rebuild_matrix(self):
+        self._matrix = np.vstack([vec for vec, _, _ in self._entries.values()]) if self._entries else None
+
+    def get(self, question: str):
+        """Return the cached answer for `question`, or None on a miss."""
+        key = self._hash(question)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._rebuild_matrix()
+            return self._entries[key][2]
+        if not self._entries:
+            return None
+        try:
+            vec = self._embed(question)
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return None
+        self._pending = (key, vec)
+        similarities = self._matrix @ vec
+        best = int(np.argmax(similarities))
+        if similarities[best] > self.similarity_threshold:
+            best_key = list(self._entries)[best]
+            self._entries.move_to_end(best_key)
+            self._rebuild_matrix()
+            return self._entries[best_key][2]
+        return None
+
+    def put(self, question: str, answer: str):
+        key = self._hash(question)
+        if self._pending and self._pending[0] == key:
+            vec = self._pending[1]
+        else:
+            try:
+                vec = self._embed(question)
+            except Exception as e:
+                logger.warning("Semantic cache embedding failed: %s", e)
+                return
+        self._pending = None
+        self._entries[key] = (vec, question, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._rebuild_matrix()
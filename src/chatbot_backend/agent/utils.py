@@ -1,41 +1,77 @@
-import sqlparse
+import re
 import pickle
+import hashlib
+import numpy as np
 import pandas as pd
 from collections import defaultdict
+from functools import lru_cache
+
+_BRACKET_RE = re.compile(r'^([^\[]+)\[(\d+)\]$')  # e.g., GPS[0] -> GPS, 0
+
+# documentation.pkl is loaded lazily exactly once per process, and the
+# formatted text is memoized on the table/column/dtype layout so repeat
+# uploads of similar logs skip the whole rebuild.
+_DOC_CACHE = {}
+
+_UNSAFE_RE = re.compile(
+    r'\b(DROP|DELETE|INSERT|UPDATE|PRAGMA|ATTACH|REPLACE|CREATE|ALTER|TRUNCATE)\b',
+    re.IGNORECASE,
+)
 
 def is_safe_query(query: str) -> bool:
-    parsed = sqlparse.parse(query)
-    for statement in parsed:
-        for token in statement.tokens:
-            if token.ttype is sqlparse.tokens.Keyword and token.value.upper() in {"DROP", "DELETE", "INSERT", "UPDATE", "PRAGMA"}:
-                return False
+    # A compiled regex scan is orders of magnitude cheaper than building a
+    # sqlparse token tree, and this runs on every query attempt and retry.
+    if _UNSAFE_RE.search(query):
+        return False
+    # Reject stacked statements outright.
+    if ';' in query.rstrip().rstrip(';'):
+        return False
     return True
 
+def _as_column(field_values):
+    values = field_values if isinstance(field_values, list) else list(field_values.values())
+    # Preallocated 1-D NumPy arrays let pandas skip per-element inference, but
+    # array-typed MAVLink fields (satellite PRNs, covariances) arrive as
+    # lists-of-lists; those stay plain lists and become object columns.
+    try:
+        arr = np.asarray(values)
+    except ValueError:
+        return values
+    return arr if arr.ndim == 1 else values
+
 def get_bin_data(parsed_messages)-> dict:
     dataframes = {}
     for msg_type, msg_data in parsed_messages.items():
-        if msg_type not in ['FILE', 'PARM']:
+        if msg_type not in ['FILE', 'PARM'] and isinstance(msg_data, dict):
             try:
-                if isinstance(msg_data, dict):
-                    df_data = {}
-                    for field_name, field_values in msg_data.items():
-                        if isinstance(field_values, list):
-                            df_data[field_name] = field_values
-                        elif isinstance(field_values, dict):
-                            df_data[field_name] = list(field_values.values())
-                    
-                    df = pd.DataFrame(df_data)
-                    if '[' in msg_type:
-                        first, number, = msg_type.split('[')[0], msg_type.split('[')[1].split(']')[0]
-                        msg_type = first + '_' + number
-                    dataframes[msg_type] = df
+                df_data = {
+                    field_name: _as_column(field_values)
+                    for field_name, field_values in msg_data.items()
+                    if isinstance(field_values, (list, dict))
+                }
+                df = pd.DataFrame(df_data)
+                match = _BRACKET_RE.match(msg_type)
+                if match:
+                    msg_type = f"{match[1]}_{match[2]}"
+                dataframes[msg_type] = df
             except Exception as e:
                 print(f"Error processing message type {msg_type}: {e}")
     return dataframes
 
-def get_bin_documentation(dataframes: dict) -> tuple[dict, list, list]:
+@lru_cache(maxsize=1)
+def _load_documentation_pkl() -> dict:
     with open("documentation.pkl", "rb") as f:
-        documentation = pickle.load(f)
+        return pickle.load(f)
+
+def get_bin_documentation(dataframes: dict) -> tuple[dict, list, list]:
+    cache_key = hashlib.blake2b(repr(sorted(
+        (key, tuple(sorted(df.columns)), str(df.dtypes.astype(str).to_dict()))
+        for key, df in dataframes.items()
+    )).encode()).hexdigest()
+    if cache_key in _DOC_CACHE:
+        return _DOC_CACHE[cache_key]
+
+    documentation = _load_documentation_pkl()
 
     instances_per_type = defaultdict(list)
     columns_per_type = defaultdict(set)
@@ -46,9 +82,8 @@ def get_bin_documentation(dataframes: dict) -> tuple[dict, list, list]:
         instances_per_type[cleaned_key].append(table_key)
         columns_per_type[cleaned_key].update(df.columns)
 
-        for col in df.columns:
-            if (cleaned_key, col) not in column_dtype_hint:
-                column_dtype_hint[(cleaned_key, col)] = str(df[col].dtype)
+        for col, dtype in df.dtypes.astype(str).items():
+            column_dtype_hint.setdefault((cleaned_key, col), dtype)
 
     documentation_text = ["Available tables in the documentation: " + ", ".join(dataframes.keys()) + "\n"]
     for msg_type, instances in instances_per_type.items():
@@ -73,4 +108,6 @@ def get_bin_documentation(dataframes: dict) -> tuple[dict, list, list]:
 
         documentation_text.append("\n".join(doc_lines))
 
-    return "\n".join(documentation_text)
\ No newline at end of file
+    result = "\n".join(documentation_text)
+    _DOC_CACHE[cache_key] = result
+    return result
\ No newline at end of file
@@ -4,17 +4,50 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from agent.PlanExecuteAgent import PlanExecuteAgent
 from agent.utils import get_bin_data
+from langchain_openai import ChatOpenAI
+import httpx
 import os
+import asyncio
 from cachetools import TTLCache
 from uuid import uuid4
 from threading import Lock
-import json
+import orjson
 
 os.environ["OPENAI_API_KEY"] = ""
 
-agents = TTLCache(maxsize=20, ttl=1800)
+class AgentCache(TTLCache):
+    """TTLCache that closes an agent's checkpoint connection on eviction."""
+
+    def popitem(self):
+        key, agent = super().popitem()
+        agent.close()
+        return key, agent
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, agent in expired:
+            agent.close()
+        return expired
+
+agents = AgentCache(maxsize=20, ttl=1800)
+# Only guards insertions; single get/set operations on TTLCache are atomic
+# under the GIL, so reads stay lock-free and unrelated sessions never
+# serialize on each other.
 agent_lock = Lock()
 
+# One shared client for all sessions: ChatOpenAI is thread-safe and a single
+# httpx pool keeps connections to OpenAI warm across concurrent chats. The
+# agents call ainvoke/astream, so the async client carries the hot path; the
+# sync client stays for any remaining blocking call sites.
+_pool_limits = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+model = ChatOpenAI(model="gpt-4o",
+                   temperature=0,
+                   max_tokens=1000,
+                   request_timeout=10,
+                   max_retries=2,
+                   http_client=httpx.Client(limits=_pool_limits),
+                   http_async_client=httpx.AsyncClient(limits=_pool_limits))
+
 app = FastAPI()
 
 app.add_middleware(
@@ -38,33 +71,32 @@ async def initialize_endpoint(req: InitializeRequest):
     if not parsed_messages:
         return {"error": "No messages provided for initialization"}
     
-    dataframes = get_bin_data(parsed_messages)
+    # DataFrame construction and agent setup are CPU/disk heavy; keep them
+    # off the event loop so concurrent chats stay responsive.
+    dataframes = await asyncio.to_thread(get_bin_data, parsed_messages)
     session_id = str(uuid4())
-    agent = PlanExecuteAgent(dataframes, session_id)
+    agent = await asyncio.to_thread(PlanExecuteAgent, dataframes, session_id, model)
     with agent_lock:
         agents[session_id] = agent
     return {"message": "Agent initialized successfully", "session_id": session_id}
 
 # @app.post("/api/chat")
-# def chat_endpoint(req: ChatRequest):
-#     with agent_lock:
-#         agent = agents.get(req.sessionId)
+# async def chat_endpoint(req: ChatRequest):
+#     agent = agents.get(req.sessionId)
 #     if not agent:
 #         return {"error": "Invalid or expired session ID"}
-#     answer = agent.call(req.message)
+#     answer = await agent.call(req.message)
 #     return {"response": answer}
 
 @app.get("/api/chat/stream")
-def chat_stream_endpoint(sessionId: str, message: str):
-    with agent_lock:
-        agent = agents.get(sessionId)
+async def chat_stream_endpoint(sessionId: str, message: str):
+    agent = agents.get(sessionId)
     if not agent:
-        def error_stream():
-            yield json.dumps({"error": "Invalid or expired session ID"})
+        async def error_stream():
+            yield orjson.dumps({"error": "Invalid or expired session ID"}).decode()
         return StreamingResponse(error_stream(), media_type="application/json")
-    
-    def event_stream():
-        for step in agent.call_stream(message):
-            print("step", step)
-            yield f"data: {json.dumps(step)}\n\n"
+
+    async def event_stream():
+        async for step in agent.call_stream(message):
+            yield f"data: {orjson.dumps(step, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()}\n\n"
     return StreamingResponse(event_stream(), media_type="text/event-stream")
\ No newline at end of file